@@ -3,12 +3,18 @@ class Config:
         self.num_epochs = 100
         self.batch_size = 4
         self.learning_rate = 0.001
+        self.cache_dir = ''  # Directory for tf.data cache files, empty keeps the cache in memory
 
         self.sr = 44100  # Sample rate
         self.hop_length = int(self.sr * (1/64))
         self.n_fft = 2048  # FFT window size for Mel-spectrogram
         self.n_mels = 229  # Number of Mel bins
         self.target_duration = 300  # Target duration of audio clips in seconds
+        self.target_length = int(self.sr * self.target_duration / self.hop_length)  # Frames per training clip
+        self.block_duration = 4  # Seconds of audio decoded per block when transcribing
+        self.chunk_length = 1024  # Frames per chunk when transcribing
+        self.chunk_overlap = 64  # Overlapping frames between consecutive chunks
+        self.jit_compile = False  # XLA-compile the transcription forward pass (replaces the cuDNN LSTM kernels)
 
         self.input_size = self.n_mels  # Input feature dimension (Mel bins)
         self.hidden_size = 512  # LSTM hidden layer size
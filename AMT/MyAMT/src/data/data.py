@@ -1,34 +1,25 @@
 import tensorflow as tf
-import pandas as pd
 import os
-import librosa
 import numpy as np
 
-def load_audio_and_labels(audio_file_path, label_file_path, sr=44100, hop_length=512, n_fft=2048, n_mels=229, target_duration=10):
-    target_length = int(sr * target_duration / hop_length)
+def load_audio_and_labels(audio_file_path, label_file_path, sr=44100, hop_length=512, n_fft=2048, n_mels=229):
+    import librosa
+    import pandas as pd
 
     audio, _ = librosa.load(audio_file_path, sr=sr, mono=True)
     mel_spec = librosa.feature.melspectrogram(y=audio, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels)
     log_mel_spec = librosa.power_to_db(mel_spec, ref=np.max)
     mel_spec_norm = (log_mel_spec - log_mel_spec.min()) / (log_mel_spec.max() - log_mel_spec.min())
-    start_index = 0
-
-    if mel_spec_norm.shape[1] > target_length:
-        max_start_index = mel_spec_norm.shape[1] - target_length
-        start_index = np.random.randint(0, max_start_index)
-        mel_spec_norm = mel_spec_norm[:, start_index:start_index + target_length]
-    else:
-        padding = -np.ones((n_mels, target_length - mel_spec_norm.shape[1]))
-        mel_spec_norm = np.concatenate((mel_spec_norm, padding), axis=1)
+    num_frames = mel_spec_norm.shape[1]
 
     labels_df = pd.read_csv(label_file_path)
-    label_tensor = np.zeros((target_length, 88), dtype=np.float32)
+    label_tensor = np.zeros((num_frames, 88), dtype=np.float32)
 
     for _, row in labels_df.iterrows():
         start_time = row['start_time'] / sr
         end_time = row['end_time'] / sr
-        start_step = max(int(start_time * sr / hop_length) - start_index, 0)
-        end_step = min(int(end_time * sr / hop_length) - start_index, target_length)
+        start_step = max(int(start_time * sr / hop_length), 0)
+        end_step = min(int(end_time * sr / hop_length), num_frames)
         note = int(row['note']) - 21
         
         if 0 <= note < 88 and start_step < end_step:
@@ -36,21 +27,58 @@ def load_audio_and_labels(audio_file_path, label_file_path, sr=44100, hop_length
 
     return mel_spec_norm.T, label_tensor
 
-def create_tf_dataset(root_dir, split, sr=44100, hop_length=512, n_fft=2048, n_mels=229, target_duration=10):
+def crop_or_pad(features, labels, target_length):
+    length = tf.shape(features)[0]
+    max_start_index = tf.maximum(length - target_length, 0)
+    start_index = tf.random.uniform([], 0, max_start_index + 1, dtype=tf.int32)
+    features = features[start_index:start_index + target_length]
+    labels = labels[start_index:start_index + target_length]
+
+    padding = target_length - tf.shape(features)[0]
+    features = tf.pad(features, [[0, padding], [0, 0]], constant_values=-1.)
+    labels = tf.pad(labels, [[0, padding], [0, 0]])
+    return tf.cast(features, tf.bfloat16), tf.cast(labels, tf.float32)
+
+FEATURE_DESCRIPTION = {
+    'mel': tf.io.FixedLenFeature([], tf.string),
+    'labels': tf.io.FixedLenFeature([], tf.string),
+    'length': tf.io.FixedLenFeature([], tf.int64),
+}
+
+def serialize_example(features, labels):
+    feature = {
+        'mel': tf.train.Feature(bytes_list=tf.train.BytesList(value=[features.astype(np.float16).tobytes()])),
+        'labels': tf.train.Feature(bytes_list=tf.train.BytesList(value=[labels.astype(np.uint8).tobytes()])),
+        'length': tf.train.Feature(int64_list=tf.train.Int64List(value=[features.shape[0]])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+def write_tfrecords(root_dir, split, sr=44100, hop_length=512, n_fft=2048, n_mels=229, files_per_shard=16):
     data_dir = os.path.join(root_dir, f'{split}_data')
     labels_dir = os.path.join(root_dir, f'{split}_labels')
+    features_dir = os.path.join(root_dir, f'{split}_features')
+    os.makedirs(features_dir, exist_ok=True)
     audio_files = sorted(os.listdir(data_dir))
-    
-    def gen():
-        for audio_file in audio_files:
-            audio_path = os.path.join(data_dir, audio_file)
-            label_path = os.path.join(labels_dir, audio_file.replace('.wav', '.csv'))
-            features, labels = load_audio_and_labels(audio_path, label_path, sr, hop_length, n_fft, n_mels, target_duration)
-            yield (features, labels)
-
-    return tf.data.Dataset.from_generator(
-        gen,
-        output_signature=(
-            tf.TensorSpec(shape=(None, n_mels), dtype=tf.float32),
-            tf.TensorSpec(shape=(None, 88), dtype=tf.float32),
-        ))
+
+    for shard, offset in enumerate(range(0, len(audio_files), files_per_shard)):
+        shard_path = os.path.join(features_dir, f'{split}-{shard:05d}.tfrecord')
+        with tf.io.TFRecordWriter(shard_path) as writer:
+            for audio_file in audio_files[offset:offset + files_per_shard]:
+                audio_path = os.path.join(data_dir, audio_file)
+                label_path = os.path.join(labels_dir, audio_file.replace('.wav', '.csv'))
+                features, labels = load_audio_and_labels(audio_path, label_path, sr, hop_length, n_fft, n_mels)
+                writer.write(serialize_example(features, labels))
+        print(f"Wrote {shard_path}")
+
+def create_tf_dataset(root_dir, split, n_mels=229):
+    shards = tf.data.Dataset.list_files(os.path.join(root_dir, f'{split}_features', '*.tfrecord'))
+
+    def parse_fn(serialized):
+        example = tf.io.parse_single_example(serialized, FEATURE_DESCRIPTION)
+        length = tf.cast(example['length'], tf.int32)
+        features = tf.reshape(tf.io.decode_raw(example['mel'], tf.float16), [length, n_mels])
+        labels = tf.reshape(tf.io.decode_raw(example['labels'], tf.uint8), [length, 88])
+        return features, labels
+
+    dataset = shards.interleave(tf.data.TFRecordDataset, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    return dataset.map(parse_fn, num_parallel_calls=tf.data.AUTOTUNE)
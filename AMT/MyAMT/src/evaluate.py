@@ -1,7 +1,7 @@
 import argparse
 import tensorflow as tf
 from conf.conf import Config
-from data.data import create_tf_dataset
+from data.data import create_tf_dataset, crop_or_pad
 from model.model import build_model
 from tensorflow.keras.models import load_model
 
@@ -15,7 +15,8 @@ def evaluate(db_location, model_path):
     print(f"Loading model from {model_path}.")
     model = load_model(model_path)
     print("Loading test dataset.")
-    test_dataset = create_tf_dataset(root_dir=db_location, split='test')
+    test_dataset = create_tf_dataset(root_dir=db_location, split='test', n_mels=config.n_mels)
+    test_dataset = test_dataset.map(lambda features, labels: crop_or_pad(features, labels, config.target_length), num_parallel_calls=tf.data.AUTOTUNE)
     test_dataset = test_dataset.batch(config.batch_size)
 
     print("Evaluating on test dataset.")
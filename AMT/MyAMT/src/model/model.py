@@ -2,6 +2,26 @@ import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 
+@keras.utils.register_keras_serializable(package='amt')
+class BinaryFocalLoss(keras.losses.Loss):
+    def __init__(self, gamma=2.0, alpha=0.25, name='binary_focal_loss', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.gamma = gamma
+        self.alpha = alpha
+
+    @tf.function(jit_compile=True)
+    def call(self, y_true, y_pred):
+        y_true = tf.cast(y_true, y_pred.dtype)
+        p = tf.clip_by_value(y_pred, keras.backend.epsilon(), 1. - keras.backend.epsilon())
+        loss = -(y_true * self.alpha * tf.pow(1. - p, self.gamma) * tf.math.log(p)
+                 + (1. - y_true) * (1. - self.alpha) * tf.pow(p, self.gamma) * tf.math.log1p(-p))
+        return tf.reduce_mean(loss, axis=-1)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'gamma': self.gamma, 'alpha': self.alpha})
+        return config
+
 def build_model(input_shape, num_notes, config):
     sequence_input = layers.Input(shape=input_shape, dtype='float32')
     masked_input = layers.Masking(mask_value=-1.)(sequence_input)
@@ -15,7 +35,7 @@ def build_model(input_shape, num_notes, config):
         lstm_out_1 = layers.Bidirectional(layers.LSTM(config.hidden_size, return_sequences=True, activation='tanh', kernel_initializer='normal'))(dropout_1)
         dropout_1 = layers.Dropout(config.dropout)(lstm_out_1)
     
-    output = layers.TimeDistributed(layers.Dense(num_notes, activation='sigmoid', kernel_initializer='normal'))(dropout_1)
+    output = layers.TimeDistributed(layers.Dense(num_notes, activation='sigmoid', kernel_initializer='normal', dtype='float32'), dtype='float32')(dropout_1)
 
     model = keras.Model(inputs=sequence_input, outputs=output)
     model.summary()
@@ -0,0 +1,19 @@
+import argparse
+from conf.conf import Config
+from data.data import write_tfrecords
+
+def precompute_features(db_location, splits, files_per_shard):
+    config = Config()
+
+    for split in splits:
+        print(f"Precomputing {split} features.")
+        write_tfrecords(root_dir=db_location, split=split, sr=config.sr, hop_length=config.hop_length, n_fft=config.n_fft, n_mels=config.n_mels, files_per_shard=files_per_shard)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute Mel-spectrogram features of MusicNet into TFRecord shards')
+    parser.add_argument('--db_location', type=str, required=True, help='Location of MusicNet database')
+    parser.add_argument('--splits', type=str, nargs='+', default=['train', 'validation', 'test'], help='Dataset splits to precompute')
+    parser.add_argument('--files_per_shard', type=int, default=16, help='Number of audio files written to each TFRecord shard')
+    args = parser.parse_args()
+
+    precompute_features(args.db_location, args.splits, args.files_per_shard)
@@ -1,23 +1,38 @@
 import argparse
-from model.model import build_model
+import os
+from model.model import build_model, BinaryFocalLoss
 from conf.conf import Config
-from data.data import create_tf_dataset
+from data.data import create_tf_dataset, crop_or_pad
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 from tensorflow.keras.metrics import Precision, Recall, BinaryAccuracy
 import tensorflow as tf
-import tensorflow.keras.backend as K
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.losses import BinaryFocalCrossentropy
+
+tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
 
 class BatchMetricsLogger(tf.keras.callbacks.Callback):
-    def on_train_batch_end(self, batch, logs=None):
-        logs = logs or {}
-        print(f"")
-        
+    def __init__(self, log_every=50):
+        super().__init__()
+        self.log_every = log_every
+
     def on_test_batch_end(self, batch, logs=None):
+        if batch % self.log_every != 0:
+            return
         logs = logs or {}
         print(f"\nValidation Batch {batch}, Loss: {logs.get('loss')}, Accuracy: {logs.get('binary_accuracy')}, Precision: {logs.get('precision')}, Recall: {logs.get('recall')}")
 
+def prepare_dataset(dataset, config, split, drop_remainder=False):
+    options = tf.data.Options()
+    options.deterministic = False
+    options.experimental_optimization.map_and_batch_fusion = True
+    options.threading.private_threadpool_size = os.cpu_count()
+
+    cache_file = os.path.join(config.cache_dir, f'amt_{split}.cache') if config.cache_dir else ''
+    dataset = dataset.cache(cache_file)
+    dataset = dataset.map(lambda features, labels: crop_or_pad(features, labels, config.target_length), num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(config.batch_size, drop_remainder=drop_remainder).prefetch(tf.data.AUTOTUNE)
+    return dataset.with_options(options)
+
 def train(db_location, load_model_path=None):
     config = Config()
     input_shape = (None, config.input_size)
@@ -28,33 +43,38 @@ def train(db_location, load_model_path=None):
     
     if load_model_path:
         filename = load_model_path.split('/')[-1]
-        epoch_str = filename.split('_')[-1]
-        initial_epoch = int(epoch_str.split('.')[0])
+        epoch_str = filename.split('_')[-1].split('.')[0]
+        initial_epoch = int(epoch_str) if epoch_str.isdigit() else 0
         print(f"Loading model from {load_model_path} at epoch {initial_epoch}.")
-        if load_model_path.endswith('.h5'):
-            model = tf.keras.models.load_model(load_model_path)
-            print(f"Model loaded successfully from {load_model_path}.")
-        else:
-            model.load_weights(load_model_path)
-            print(f"Weights loaded successfully from {load_model_path}.")
     else:
         print("Starting training with a new model.")
+
+    if load_model_path and load_model_path.endswith('.h5') and not load_model_path.endswith('.weights.h5'):
+        model = tf.keras.models.load_model(load_model_path)
+        print(f"Model loaded successfully from {load_model_path}.")
+    else:
+        if load_model_path:
+            model.load_weights(load_model_path)
+            print(f"Weights loaded successfully from {load_model_path}.")
         optimizer = Adam()
-        loss_function = BinaryFocalCrossentropy(gamma=config.gamma,alpha=config.alpha, apply_class_balancing=True)
+        loss_function = BinaryFocalLoss(gamma=config.gamma, alpha=config.alpha)
         accuracy = BinaryAccuracy(name = 'binary_accuracy', threshold = 0.5)
         model.compile(optimizer=optimizer, loss=loss_function, metrics=[accuracy, Precision(thresholds = 0.5), Recall(thresholds = 0.5)])
 
-    train_dataset = create_tf_dataset(root_dir=db_location, split='train', sr=config.sr, hop_length=config.hop_length, n_fft=config.n_fft, n_mels=config.n_mels, target_duration=config.target_duration)
-    val_dataset = create_tf_dataset(root_dir=db_location, split='validation', sr=config.sr, hop_length=config.hop_length, n_fft=config.n_fft, n_mels=config.n_mels, target_duration=config.target_duration)
+    train_dataset = create_tf_dataset(root_dir=db_location, split='train', n_mels=config.n_mels)
+    val_dataset = create_tf_dataset(root_dir=db_location, split='validation', n_mels=config.n_mels)
+    train_dataset = prepare_dataset(train_dataset, config, 'train', drop_remainder=True)
+    val_dataset = prepare_dataset(val_dataset, config, 'validation')
     callbacks = [
-        ModelCheckpoint("/checkpoints_{epoch:03d}.h5", save_weights_only=False, save_best_only=False, verbose=1),
+        ModelCheckpoint("/checkpoints_{epoch:03d}.weights.h5", save_weights_only=True, save_freq='epoch', verbose=1),
+        ModelCheckpoint("/best_model_{epoch:03d}.h5", monitor='val_loss', save_best_only=True, verbose=1),
         EarlyStopping(monitor='val_loss', patience=10, min_delta=0, restore_best_weights=True, verbose=1, mode='auto'),
         BatchMetricsLogger()
     ]
     history = model.fit(
-        train_dataset.batch(config.batch_size),
+        train_dataset,
         epochs=config.num_epochs,
-        validation_data=val_dataset.batch(config.batch_size),
+        validation_data=val_dataset,
         callbacks=[callbacks],
         initial_epoch=initial_epoch
     )
@@ -1,37 +1,75 @@
 import argparse
+import gc
 import os
-from utils.utils import preprocess_audio, prediction_to_midi
-from model.model import build_model
+from utils.utils import preprocess_audio, prediction_to_midi, count_frames
 from conf.conf import Config
 import tensorflow as tf
-import numpy as np
 import glob
 
 def load_and_configure_model(checkpoint_location, config):
-    input_shape = (None, config.input_size)
-    num_notes = config.output_size
+    model = tf.keras.models.load_model(checkpoint_location, compile=False)
+    return model
 
-    model = build_model(input_shape, num_notes, config)
+def build_predict_fn(model, config):
+    @tf.function(autograph=False, jit_compile=config.jit_compile)
+    def predict_fn(audio):
+        return model(audio, training=False)
+    return predict_fn
 
-    model = tf.keras.models.load_model(checkpoint_location)
-    return model
+def bucket_length(length):
+    return 1 << (length - 1).bit_length()
+
+def count_chunks(num_frames, config):
+    step = config.chunk_length - config.chunk_overlap
+    return -(-num_frames // step)
+
+def trace_buckets(predict_fn, audio_paths, config):
+    buckets = {bucket_length(count_chunks(count_frames(audio_path, config), config)) for audio_path in audio_paths}
 
-def transcribe(audio_path, model, output_path, config):
-    audio, tempo = preprocess_audio(audio_path, config)
-    audio = np.expand_dims(audio, axis=0)
+    gc.collect()
+    gc.freeze()
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for bucket in sorted(buckets):
+            print(f"Tracing model for {bucket} chunks")
+            predict_fn.get_concrete_function(tf.TensorSpec((bucket, config.chunk_length, config.n_mels), tf.float32))
+    finally:
+        if was_enabled:
+            gc.enable()
+        gc.unfreeze()
 
-    prediction = model.predict(audio)
-    prediction_to_midi(prediction, tempo, output_path)
+def split_into_chunks(audio, config):
+    step = config.chunk_length - config.chunk_overlap
+    chunks = tf.signal.frame(audio, config.chunk_length, step, pad_end=True, pad_value=-1., axis=0)
+    num_chunks = count_chunks(audio.shape[0], config)
+    return tf.pad(chunks, [[0, bucket_length(num_chunks) - num_chunks], [0, 0], [0, 0]], constant_values=-1.)
 
-def process_folder(input_folder, model, output_folder, config):
+def stitch_chunks(predictions, num_frames, config):
+    step = config.chunk_length - config.chunk_overlap
+    half_overlap = config.chunk_overlap // 2
+    body = tf.reshape(predictions[:, half_overlap:half_overlap + step], (-1, predictions.shape[-1]))
+    return tf.concat([predictions[0, :half_overlap], body], axis=0)[:num_frames]
+
+def transcribe(audio_path, predict_fn, output_path, config):
+    audio = preprocess_audio(audio_path, config)
+    chunks = split_into_chunks(audio, config)
+
+    prediction = stitch_chunks(predict_fn(chunks), audio.shape[0], config).numpy()
+    prediction_to_midi(prediction, output_path)
+
+def process_folder(input_folder, predict_fn, output_folder, config):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for audio_path in glob.glob(os.path.join(input_folder, '*.wav')):
+    audio_paths = glob.glob(os.path.join(input_folder, '*.wav'))
+    trace_buckets(predict_fn, audio_paths, config)
+
+    for audio_path in audio_paths:
         file_name = os.path.basename(audio_path)
         output_path = os.path.join(output_folder, file_name.replace('.wav', '.mid'))
         print(f"Transcribing {audio_path} to {output_path}")
-        transcribe(audio_path, model, output_path, config)
+        transcribe(audio_path, predict_fn, output_path, config)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Transcribe audio files in a folder using a trained model')
@@ -41,6 +79,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     config = Config()
+    if config.jit_compile:
+        # TensorFlow reads TF_XLA_FLAGS when XLA is first used, so this still applies after the import above.
+        os.environ.setdefault('TF_XLA_FLAGS', '--tf_xla_persistent_cache_directory=' + os.path.expanduser('~/.cache/amt/xla'))
     model = load_and_configure_model(args.checkpoint_path, config)
+    predict_fn = build_predict_fn(model, config)
 
-    process_folder(args.input_folder, model, args.output_folder, config)
+    process_folder(args.input_folder, predict_fn, args.output_folder, config)
@@ -1,17 +1,76 @@
-import librosa
+import functools
+import math
 import numpy as np
+import soundfile as sf
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
 from conf.conf import Config
 import pretty_midi
 
+@functools.lru_cache(maxsize=None)
+def mel_filterbank(sr, n_fft, n_mels):
+    import librosa
+    return tf.constant(librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).T)
+
+def mel_power_spectrogram(audio, config, mel_basis):
+    stft = tf.signal.stft(audio, frame_length=config.n_fft, frame_step=config.hop_length, fft_length=config.n_fft, window_fn=tf.signal.hann_window)
+    return tf.matmul(tf.math.square(tf.abs(stft)), mel_basis)
+
+def normalize_mel_spectrogram(mel_spec):
+    log_mel_spec = 10.0 * tf.experimental.numpy.log10(tf.maximum(mel_spec, 1e-10))
+    log_mel_spec = tf.maximum(log_mel_spec - tf.reduce_max(log_mel_spec), -80.0)
+    min_value, max_value = tf.reduce_min(log_mel_spec), tf.reduce_max(log_mel_spec)
+    return (log_mel_spec - min_value) / (max_value - min_value)
+
+def extract_features(audio, config):
+    mel_basis = mel_filterbank(config.sr, config.n_fft, config.n_mels)
+    padded = tf.pad(tf.constant(audio), [[config.n_fft // 2, config.n_fft // 2]], mode='REFLECT')
+    return normalize_mel_spectrogram(mel_power_spectrogram(padded, config, mel_basis))
+
+def read_frames(sound_file, start_frame, stop_frame, config):
+    start = start_frame * config.hop_length - config.n_fft // 2
+    stop = (stop_frame - 1) * config.hop_length + config.n_fft // 2
+    sound_file.seek(max(start, 0))
+    block = sound_file.read(min(stop, sound_file.frames) - max(start, 0), dtype='float32', always_2d=True).mean(axis=1)
+
+    if start < 0:
+        block = np.concatenate([block[1:1 - start][::-1], block])
+    if stop > sound_file.frames:
+        block = np.concatenate([block, block[-1 - (stop - sound_file.frames):-1][::-1]])
+    return block
+
+def stream_features(audio_path, config):
+    mel_basis = mel_filterbank(config.sr, config.n_fft, config.n_mels)
+    frames_per_block = config.block_duration * config.sr // config.hop_length
+    mel_blocks = []
+
+    with sf.SoundFile(audio_path) as sound_file, ThreadPoolExecutor(max_workers=1) as executor:
+        num_frames = 1 + sound_file.frames // config.hop_length
+        block_starts = range(0, num_frames, frames_per_block)
+        future = executor.submit(read_frames, sound_file, 0, min(frames_per_block, num_frames), config)
+
+        for start_frame in block_starts:
+            block = future.result()
+            next_start = start_frame + frames_per_block
+            if next_start < num_frames:
+                future = executor.submit(read_frames, sound_file, next_start, min(next_start + frames_per_block, num_frames), config)
+            mel_blocks.append(mel_power_spectrogram(tf.constant(block), config, mel_basis))
+
+    return normalize_mel_spectrogram(tf.concat(mel_blocks, axis=0))
+
+def count_frames(audio_path, config):
+    info = sf.info(audio_path)
+    return 1 + math.ceil(info.frames * config.sr / info.samplerate) // config.hop_length
+
 def preprocess_audio(audio_path, config):
+    if sf.info(audio_path).samplerate == config.sr:
+        return stream_features(audio_path, config)
+
+    import librosa
     audio, _ = librosa.load(audio_path, sr=config.sr, mono=True)
-    tempo, _ = librosa.beat.beat_track(y=audio, sr=config.sr)
-    mel_spec = librosa.feature.melspectrogram(y=audio, sr=config.sr, n_fft=config.n_fft, hop_length=config.hop_length, n_mels=config.n_mels)
-    log_mel_spec = librosa.power_to_db(mel_spec, ref=np.max)
-    mel_spec_norm = (log_mel_spec - log_mel_spec.min()) / (log_mel_spec.max() - log_mel_spec.min())
-    return mel_spec_norm.T, tempo
+    return extract_features(audio, config)
 
-def prediction_to_midi(predictions, tempo, output_path="output.mid"):
+def prediction_to_midi(predictions, output_path="output.mid"):
     midi_data = pretty_midi.PrettyMIDI()
     piano_program = pretty_midi.instrument_name_to_program('Acoustic Grand Piano')
     piano = pretty_midi.Instrument(program=piano_program)
@@ -19,39 +78,21 @@ def prediction_to_midi(predictions, tempo, output_path="output.mid"):
     predictions = np.squeeze(predictions)
     predictions_transformed = transform_predictions(predictions)
 
-    for note_info in predictions_transformed:
-        note, start_time, duration = note_info
-        midi_note = pretty_midi.Note(
-            velocity=100,
-            pitch=note + 21,
-            start=start_time,
-            end=start_time + duration
-        )
-        piano.notes.append(midi_note)
+    piano.notes = [
+        pretty_midi.Note(velocity=100, pitch=note + 21, start=start_time, end=start_time + duration)
+        for note, start_time, duration in predictions_transformed
+    ]
 
     midi_data.instruments.append(piano)
     midi_data.write(output_path)
 
 def transform_predictions(predictions, threshold=0.5, config = Config()):
-    results = []
-    active_notes = {note: None for note in range(88)}
-
-    for time_step in range(predictions.shape[0]):
-        for note in range(predictions.shape[1]):
-            activation = predictions[time_step, note]
-
-            if activation > threshold and active_notes[note] is None:
-                active_notes[note] = time_step * config.hop_length / config.sr
-
-            elif activation <= threshold and active_notes[note] is not None:
-                start_time = active_notes[note]
-                duration = (time_step * config.hop_length / config.sr) - start_time
-                results.append((note, start_time, duration))
-                active_notes[note] = None
+    active = np.pad(predictions > threshold, ((1, 1), (0, 0))).astype(np.int8)
+    changes = np.diff(active, axis=0).T
 
-    for note, start_time in active_notes.items():
-        if start_time is not None:
-            duration = (predictions.shape[0]* config.hop_length / config.sr) - start_time
-            results.append((note, start_time, duration))
+    notes, onsets = np.nonzero(changes == 1)
+    _, offsets = np.nonzero(changes == -1)
+    start_times = onsets * config.hop_length / config.sr
+    durations = offsets * config.hop_length / config.sr - start_times
 
-    return results
\ No newline at end of file
+    return list(zip(notes.tolist(), start_times.tolist(), durations.tolist()))